@@ -1,4 +1,3 @@
-import logging
 from enum import Enum
 
 from .serial_protocol import BraviaDisplaySerialPort
@@ -47,7 +46,6 @@ class BraviaDisplay:
 
     def __init__(self, bravia_serial_port: BraviaDisplaySerialPort):
         self.bravia_serial_port = bravia_serial_port
-        self._logger = logging.getLogger(__name__)
 
     def get_power_mode(self) -> bool:
         """
@@ -55,7 +53,7 @@ class BraviaDisplay:
         is powered off.
         """
         response_bytes = self.bravia_serial_port.request_read(
-            _BRAVIA_POWER_STATE_FUNCTION_BYTE
+            _BRAVIA_POWER_STATE_FUNCTION_BYTE, expected_payload_length=1
         )
         if response_bytes[0] == 0x00:
             return False
@@ -83,7 +81,7 @@ class BraviaDisplay:
 
     def get_input_mode(self) -> InputMode:
         response_bytes = self.bravia_serial_port.request_read(
-            _BRAVIA_INPUT_MODE_FUNCTION_BYTE
+            _BRAVIA_INPUT_MODE_FUNCTION_BYTE, expected_payload_length=2
         )
         input_mode_enum_value = ((response_bytes[0] & 0x0F) << 4) | (
             response_bytes[1] & 0x0F
@@ -1,10 +1,16 @@
+import io
 import logging
-from typing import Iterable, Sequence
+import math
+import select
+import time
+from typing import Dict, Iterable, Optional
 
 import serial
 
 from .util import dump_bytes_to_str
 
+_logger = logging.getLogger(__name__)
+
 _BRAVIA_READ_REQUEST_HEADER_BYTE = 0x83
 _BRAVIA_WRITE_REQUEST_HEADER_BYTE = 0x8C
 
@@ -15,48 +21,78 @@ _BRAVIA_REQUEST_CATEGORY_BYTE = 0x00
 # First byte sent in response to a read/write request.
 _BRAVIA_RESPONSE_HEADER_BYTE = 0x70
 
+# How long to sleep between reads of a non-blocking port that can't be waited
+# on with select()
+_POLL_INTERVAL_SECS = 0.001
+
+# Error messages for the answer byte of a response, indexed by answer byte.
+# 0x00 means no error.
+_RESPONSE_ANSWER_ERRORS = (
+    None,
+    "Limit Over (Abnormal End - over maximum value)",
+    "Limit Over (Abnormal End - under minimum value)",
+    "Command Canceled (Abnormal End)",
+    "Parse Error (Data Format Error)",
+)
+
+# Read requests are fully determined by their function byte, so each framed
+# request is built once and reused. Maps function byte -> framed request.
+_READ_FRAMES: Dict[int, bytes] = {}
+
 
 class BraviaDisplaySerialPort:
     """
     Implements the low-level serial protocol for communicating with a Sony
     Bravia display.
+
+    response_timeout is the maximum number of seconds to wait for a response;
+    if None, the serial port's own timeout is used. Opening the serial port
+    with timeout=0 and passing a response_timeout lets responses be awaited
+    with select() rather than pyserial's blocking reads, which wakes up as
+    soon as data arrives. Ports that can't be select()ed are polled instead.
     """
 
-    def __init__(self, serial_port: serial.Serial):
+    def __init__(
+        self, serial_port: serial.Serial, response_timeout: Optional[float] = None
+    ):
         self.serial_port = serial_port
-        self._logger = logging.getLogger(__name__)
+        self.response_timeout = response_timeout
 
-    def request_read(self, function_byte: int) -> bytes:
+    def request_read(
+        self, function_byte: int, expected_payload_length: Optional[int] = None
+    ) -> bytes:
         """
         Sends a read request using the specified function byte. Returns a
         response payload containing the result of the read request; the format
         of its contents depend on the function byte.
-        """
-        _validate_function_byte(function_byte)
 
-        message = [
-            _BRAVIA_READ_REQUEST_HEADER_BYTE,
-            _BRAVIA_REQUEST_CATEGORY_BYTE,
-            function_byte,
-            0xFF,
-            0xFF,
-        ]
-        message.append(_calculate_checksum(message))
+        expected_payload_length is an optional hint of the response payload's
+        length (excluding the checksum), which allows the whole response to be
+        read at once when the serial port is non-blocking.
+        """
+        message = _READ_FRAMES.get(function_byte)
+        if message is None:
+            _validate_function_byte(function_byte)
+            message = _READ_FRAMES.setdefault(
+                function_byte, _build_read_frame(function_byte)
+            )
 
-        self._logger.debug(
-            "Sending Bravia read request on %s: %s",
-            self.serial_port.name,
-            dump_bytes_to_str(message),
-        )
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(
+                "Sending Bravia read request on %s: %s",
+                self.serial_port.name,
+                dump_bytes_to_str(message),
+            )
         self.serial_port.write(message)
-        return self._get_read_request_response()
+        return self._get_read_request_response(expected_payload_length)
 
-    def request_write(self, function_byte: int, payload: Sequence[int]) -> None:
+    def request_write(self, function_byte: int, payload: Iterable[int]) -> None:
         """
         Sends a write request using the specified function byte and
         corresponding payload. Does not return a response.
         """
         _validate_function_byte(function_byte)
+        payload = bytes(payload)
 
         # Length of the payload plus the checksum
         message_length_byte = len(payload) + 1
@@ -65,25 +101,58 @@ class BraviaDisplaySerialPort:
                 f"Payload is too large (expected length <= 254 bytes, got {len(payload)} bytes)"
             )
 
-        message = [
-            _BRAVIA_WRITE_REQUEST_HEADER_BYTE,
-            _BRAVIA_REQUEST_CATEGORY_BYTE,
-            function_byte,
-            message_length_byte,
-            *payload,
-        ]
-        message.append(_calculate_checksum(message))
-
-        self._logger.debug(
-            "Sending Bravia write request on %s: %s",
-            self.serial_port.name,
-            dump_bytes_to_str(message),
+        # Checksum is accumulated from the parts of the message rather than by
+        # summing the message once it has been built
+        checksum = (
+            _BRAVIA_WRITE_REQUEST_HEADER_BYTE
+            + _BRAVIA_REQUEST_CATEGORY_BYTE
+            + function_byte
+            + message_length_byte
+            + sum(payload)
+        ) & 0xFF
+
+        # Built as bytes rather than a bytearray, which pyserial would otherwise
+        # copy into a new bytes object on write
+        message = bytes(
+            (
+                _BRAVIA_WRITE_REQUEST_HEADER_BYTE,
+                _BRAVIA_REQUEST_CATEGORY_BYTE,
+                function_byte,
+                message_length_byte,
+                *payload,
+                checksum,
+            )
         )
+
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(
+                "Sending Bravia write request on %s: %s",
+                self.serial_port.name,
+                dump_bytes_to_str(message),
+            )
         self.serial_port.write(message)
         self._get_write_request_response()
 
-    def _get_read_request_response(self) -> bytes:
-        initial_response_bytes = self.serial_port.read(3)
+    def _get_read_request_response(
+        self, expected_payload_length: Optional[int]
+    ) -> bytes:
+        deadline = self._get_response_deadline()
+
+        # Reads from a non-blocking port only return what has already arrived,
+        # so it's safe to ask for the whole expected response up front even if
+        # the Bravia ends up sending a shorter (e.g. error) response
+        speculative_length = 3
+        if expected_payload_length is not None and self._is_nonblocking():
+            speculative_length += expected_payload_length + 1
+
+        response_bytes = self._read_exactly(3, deadline, speculative_length)
+        initial_response_bytes = response_bytes[:3]
+        if len(initial_response_bytes) != 3:
+            raise RuntimeError(
+                f"Received response with unexpected length (expected 3 bytes, "
+                f"got {len(initial_response_bytes)} bytes)"
+            )
+
         response_header = initial_response_bytes[0]
         if response_header != _BRAVIA_RESPONSE_HEADER_BYTE:
             raise RuntimeError(
@@ -94,7 +163,11 @@ class BraviaDisplaySerialPort:
 
         # Read the response payload
         payload_length = initial_response_bytes[2]
-        payload_with_checksum: bytes = self.serial_port.read(size=payload_length)
+        payload_with_checksum = response_bytes[3 : 3 + payload_length]
+        if len(payload_with_checksum) < payload_length:
+            payload_with_checksum += self._read_exactly(
+                payload_length - len(payload_with_checksum), deadline
+            )
         if len(payload_with_checksum) != payload_length:
             raise RuntimeError(
                 (
@@ -107,18 +180,20 @@ class BraviaDisplaySerialPort:
 
         # Checksum includes bytes from the initial response as well as the
         # payload
-        _validate_payload_checksum([*initial_response_bytes, *payload_with_checksum])
+        _validate_payload_checksum(initial_response_bytes + payload_with_checksum)
 
-        self._logger.debug(
-            "Received query response from Bravia on %s: %s",
-            self.serial_port.name,
-            dump_bytes_to_str(payload_without_checksum),
-        )
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(
+                "Received query response from Bravia on %s: %s",
+                self.serial_port.name,
+                dump_bytes_to_str(payload_without_checksum),
+            )
 
         return payload_without_checksum
 
     def _get_write_request_response(self) -> None:
-        raw_response = self.serial_port.read(3)
+        deadline = self._get_response_deadline()
+        raw_response = self._read_exactly(3, deadline)
         expected_raw_response_len = 3
         if len(raw_response) != expected_raw_response_len:
             raise ValueError(
@@ -138,26 +213,117 @@ class BraviaDisplaySerialPort:
         _validate_payload_checksum(raw_response)
         _validate_response_answer_byte(raw_response[1])
 
-        self._logger.debug(
-            "Received Bravia response on %s: %s",
-            self.serial_port.name,
-            dump_bytes_to_str(raw_response),
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(
+                "Received Bravia response on %s: %s",
+                self.serial_port.name,
+                dump_bytes_to_str(raw_response),
+            )
+
+    def _get_response_deadline(self) -> float:
+        """
+        Returns the time.monotonic() value after which reading a response is
+        considered to have timed out.
+        """
+        timeout = self.response_timeout
+        if timeout is None:
+            timeout = self.serial_port.timeout
+        if timeout is None:
+            # Blocking port, wait indefinitely like pyserial would
+            return math.inf
+        return time.monotonic() + timeout
+
+    def _is_nonblocking(self) -> bool:
+        return self.serial_port.timeout == 0
+
+    def _can_select(self) -> bool:
+        """
+        Returns True if the serial port is backed by a file descriptor that can
+        be waited on with select(). This isn't the case on Windows or for URL
+        ports such as socket:// or loop://, whose fileno() raises.
+        """
+        try:
+            self.serial_port.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            return False
+        return True
+
+    def _read_exactly(
+        self, n: int, deadline: float, max_n: Optional[int] = None
+    ) -> bytes:
+        """
+        Reads n bytes from the serial port, retrying short reads until either
+        all bytes have arrived or the deadline passes. Returns however many
+        bytes were read, which may be fewer than n on timeout.
+
+        If max_n is given, the first read asks for up to max_n bytes, so more
+        than n bytes may be returned.
+        """
+        nonblocking = self._is_nonblocking()
+        use_select = nonblocking and self._can_select()
+        read_size = n if max_n is None else max(n, max_n)
+
+        buf = bytearray()
+        while len(buf) < n:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            if use_select:
+                readable, _, _ = select.select(
+                    [self.serial_port],
+                    [],
+                    [],
+                    None if remaining == math.inf else remaining,
+                )
+                if not readable:
+                    break
+
+            chunk = self.serial_port.read(read_size)
+            if not chunk and nonblocking and not use_select:
+                # Nothing to wait on, so poll without spinning
+                time.sleep(min(_POLL_INTERVAL_SECS, remaining))
+
+            buf += chunk
+            read_size = n - len(buf)
+        return bytes(buf)
+
+
+def _build_read_frame(function_byte: int) -> bytes:
+    checksum = (
+        _BRAVIA_READ_REQUEST_HEADER_BYTE
+        + _BRAVIA_REQUEST_CATEGORY_BYTE
+        + function_byte
+        + 0xFF
+        + 0xFF
+    ) & 0xFF
+    return bytes(
+        (
+            _BRAVIA_READ_REQUEST_HEADER_BYTE,
+            _BRAVIA_REQUEST_CATEGORY_BYTE,
+            function_byte,
+            0xFF,
+            0xFF,
+            checksum,
         )
+    )
 
 
 def _validate_function_byte(function_byte: int) -> None:
-    if function_byte < 0 or function_byte > 255:
+    # Any bits set outside the low byte (including the sign for negative values)
+    # means the value doesn't fit in a byte
+    if function_byte & ~0xFF:
         raise ValueError(
-            f"Invalid function (expected 0 <= function <= 255, got {function_byte})"
+            f"Invalid function byte (expected 0 <= function_byte <= 255, got {function_byte})"
         )
 
 
-def _calculate_checksum(payload: Iterable[int]) -> int:
+def _calculate_checksum(payload: bytes) -> int:
     # Checksum is the LSB of the sum of the payload bytes
     return sum(payload) & 0xFF
 
 
-def _validate_payload_checksum(payload_with_checksum: Sequence[int]) -> None:
+def _validate_payload_checksum(payload_with_checksum: bytes) -> None:
     # Checksum is in last byte and is
     expected_checksum = _calculate_checksum(payload_with_checksum[:-1])
     actual_checksum = payload_with_checksum[-1]
@@ -175,14 +341,11 @@ def _validate_response_answer_byte(response_answer: int) -> None:
         # No error
         return
 
-    error_messages = {
-        0x01: "Limit Over (Abnormal End - over maximum value)",
-        0x02: "Limit Over (Abnormal End - under minimum value)",
-        0x03: "Command Canceled (Abnormal End)",
-        0x04: "Parse Error (Data Format Error)",
-    }
-
-    error_message = error_messages.get(response_answer)
+    error_message = (
+        _RESPONSE_ANSWER_ERRORS[response_answer]
+        if response_answer < len(_RESPONSE_ANSWER_ERRORS)
+        else None
+    )
     if error_message is None:
         error_message = f"Unrecognized response answer 0x{response_answer:02X}"
 
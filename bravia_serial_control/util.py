@@ -2,4 +2,6 @@ from typing import Iterable
 
 
 def dump_bytes_to_str(payload: Iterable[int]) -> str:
-    return f'[{", ".join("0x{:02X}".format(b) for b in payload)}]'
+    hex_str = bytes(payload).hex().upper()
+    hex_bytes = ("0x" + hex_str[i : i + 2] for i in range(0, len(hex_str), 2))
+    return f'[{", ".join(hex_bytes)}]'
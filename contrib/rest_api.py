@@ -1,10 +1,10 @@
-import datetime
 import functools
 import logging
+import os
 import threading
 import time
 from contextlib import contextmanager
-from typing import Iterable, Optional
+from typing import Iterator, Optional, Tuple, Type
 
 import serial
 from flask import Flask, abort, jsonify, request
@@ -12,46 +12,67 @@ from flask import Flask, abort, jsonify, request
 from bravia_serial_control.display import BraviaDisplay, InputMode, PictureMode
 from bravia_serial_control.serial_protocol import BraviaDisplaySerialPort
 
+# Errors that mean the serial port itself has failed (e.g. the adapter was
+# unplugged), after which it needs to be reopened. pyserial's termios calls
+# (e.g. tcflush) raise termios.error, which isn't an OSError.
+try:
+    import termios
+
+    _SERIAL_PORT_ERRORS: Tuple[Type[BaseException], ...] = (
+        serial.SerialException,
+        OSError,
+        termios.error,
+    )
+except ImportError:  # Windows
+    _SERIAL_PORT_ERRORS = (serial.SerialException, OSError)
+
 
 COMMAND_INTERVAL_SECS = 0.5
+SERIAL_PORT = "/dev/ttyUSB0"
 
-app = Flask(__name__)
-lock = threading.Lock()
-last_request_time: Optional[datetime.datetime] = None
+# FTDI adapters buffer incoming bytes for latency_timer milliseconds (16 by
+# default) before handing them to the host, which dominates the round trip time
+# of the Bravia's tiny responses.
+USB_SERIAL_LATENCY_TIMER_MS = os.environ.get("BRAVIA_USB_LATENCY_TIMER_MS", "1")
 
+app = Flask(__name__)
+device_lock = threading.Lock()
+last_request_time: Optional[float] = None
+_bravia: Optional[BraviaDisplay] = None
 
-def throttled_request(f):
-    @functools.wraps(f)
-    def wrapper(*args, **kwargs):
-        global last_request_time
-        with lock:
-            if last_request_time is not None:
-                secs_since_last_request = (
-                    datetime.datetime.now() - last_request_time
-                ).total_seconds()
+# Modes are named in requests and responses by their lowercased enum names
+_PICTURE_MODE_NAMES = {mode: mode.name.lower() for mode in PictureMode}
+_PICTURE_MODE_BY_NAME = {name: mode for mode, name in _PICTURE_MODE_NAMES.items()}
+_INPUT_MODE_NAMES = {mode: mode.name.lower() for mode in InputMode}
+_INPUT_MODE_BY_NAME = {name: mode for mode, name in _INPUT_MODE_NAMES.items()}
 
-                if secs_since_last_request < COMMAND_INTERVAL_SECS:
-                    secs_to_wait = COMMAND_INTERVAL_SECS - secs_since_last_request
-                    logging.info("Throttling for %.3f seconds", secs_to_wait)
-                    time.sleep(secs_to_wait)
 
-            return_value = f(*args, **kwargs)
+def retry_on_serial_error(f):
+    """
+    Retries the handler once after open_bravia() has closed a failed port.
+    Only wrap idempotent handlers, as the retry re-sends any command.
+    """
 
-            last_request_time = datetime.datetime.now()
-            return return_value
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        except _SERIAL_PORT_ERRORS:
+            return f(*args, **kwargs)
 
     return wrapper
 
 
 @app.route("/power", methods=["GET", "POST"])
-@throttled_request
+@retry_on_serial_error
 def power():
     if request.method == "GET":
         with open_bravia() as bravia:
-            return jsonify({"power": "on" if bravia.get_power_mode() else "off"})
+            current_mode = bravia.get_power_mode()
+        return jsonify({"power": "on" if current_mode else "off"})
 
     if request.method == "POST":
-        raw_requested_mode = request.json.get("power").lower()
+        raw_requested_mode = get_requested_value("power").lower()
         if raw_requested_mode == "off":
             requested_mode = False
         elif raw_requested_mode == "on":
@@ -61,53 +82,146 @@ def power():
 
         with open_bravia() as bravia:
             bravia.set_power_mode(requested_mode)
-            return jsonify({"power": "on" if requested_mode else "off"})
+        return jsonify({"power": "on" if requested_mode else "off"})
 
     abort(405)
 
 
 @app.route("/picture_mode", methods=["POST"])
-@throttled_request
+@retry_on_serial_error
 def picture_mode():
-    raw_requested_mode = request.json.get("picture_mode").upper()
-
-    try:
-        requested_mode = PictureMode[raw_requested_mode]
-    except ValueError:
+    raw_requested_mode = get_requested_value("picture_mode").lower()
+    requested_mode = _PICTURE_MODE_BY_NAME.get(raw_requested_mode)
+    if requested_mode is None:
         abort(400)
 
     with open_bravia() as bravia:
         bravia.set_picture_mode(requested_mode)
-        return jsonify({"picture_mode": requested_mode.name.lower()})
+    return jsonify({"picture_mode": _PICTURE_MODE_NAMES[requested_mode]})
 
 
 @app.route("/input_mode", methods=["GET", "POST"])
-@throttled_request
+@retry_on_serial_error
 def input_mode():
     if request.method == "GET":
         with open_bravia() as bravia:
-            return jsonify({"input_mode": bravia.get_input_mode().name.lower()})
+            current_mode = bravia.get_input_mode()
+        return jsonify({"input_mode": _INPUT_MODE_NAMES[current_mode]})
 
     if request.method == "POST":
-        raw_requested_mode = request.json.get("input_mode").lower()
-
-        try:
-            requested_mode = InputMode[raw_requested_mode]
-        except ValueError:
+        raw_requested_mode = get_requested_value("input_mode").lower()
+        requested_mode = _INPUT_MODE_BY_NAME.get(raw_requested_mode)
+        if requested_mode is None:
             abort(400)
 
         with open_bravia() as bravia:
             bravia.set_input_mode(requested_mode)
-            return jsonify({"input_mode": requested_mode.name.lower()})
+        return jsonify({"input_mode": _INPUT_MODE_NAMES[requested_mode]})
 
     abort(405)
 
 
+def get_requested_value(key: str) -> str:
+    """
+    Returns the string value of key in the request's JSON body, aborting with
+    400 Bad Request if the body isn't JSON or the value is missing or empty.
+    """
+    data = request.get_json(silent=True)
+    value = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(value, str) or not value:
+        abort(400)
+
+    return value
+
+
 @contextmanager
-def open_bravia() -> Iterable[BraviaDisplay]:
-    with serial.Serial(port="/dev/ttyUSB0", baudrate=9600, timeout=5) as raw_serial:
-        bravia_serial = BraviaDisplaySerialPort(raw_serial)
-        yield BraviaDisplay(bravia_serial)
+def open_bravia() -> Iterator[BraviaDisplay]:
+    """
+    Holds device_lock for the duration of the block and yields the shared Bravia
+    display handle, first waiting until at least COMMAND_INTERVAL_SECS have
+    passed since the previous serial transaction finished. If the serial port
+    fails, including while get_bravia() flushes it, the port is closed so that
+    the next request reopens it.
+    """
+    global last_request_time
+    with device_lock:
+        if last_request_time is not None:
+            secs_since_last_request = time.monotonic() - last_request_time
+            if secs_since_last_request < COMMAND_INTERVAL_SECS:
+                secs_to_wait = COMMAND_INTERVAL_SECS - secs_since_last_request
+                logging.info("Throttling for %.3f seconds", secs_to_wait)
+                time.sleep(secs_to_wait)
+
+        try:
+            yield get_bravia()
+        except _SERIAL_PORT_ERRORS:
+            logging.exception("Serial error, closing %s", SERIAL_PORT)
+            close_bravia()
+            raise
+        finally:
+            last_request_time = time.monotonic()
+
+
+def get_bravia() -> BraviaDisplay:
+    """
+    Returns the shared Bravia display handle, opening the serial port if it
+    isn't already open. Must be called with device_lock held.
+    """
+    global _bravia
+    if _bravia is None or not _bravia.bravia_serial_port.serial_port.is_open:
+        raw_serial = serial.Serial(port=SERIAL_PORT, baudrate=9600, timeout=0)
+        try:
+            set_low_latency(raw_serial)
+            _bravia = BraviaDisplay(
+                BraviaDisplaySerialPort(raw_serial, response_timeout=5)
+            )
+        except BaseException:
+            raw_serial.close()
+            raise
+    else:
+        # Discard any stray bytes left over from a previous request that timed
+        # out, as a freshly opened port would
+        _bravia.bravia_serial_port.serial_port.reset_input_buffer()
+
+    return _bravia
+
+
+def close_bravia() -> None:
+    """
+    Closes the shared Bravia display handle, if any, so that the next call to
+    get_bravia() reopens the serial port. Must be called with device_lock held.
+    """
+    global _bravia
+    if _bravia is not None:
+        try:
+            _bravia.bravia_serial_port.serial_port.close()
+        except _SERIAL_PORT_ERRORS:
+            pass
+        _bravia = None
+
+
+def set_low_latency(raw_serial: serial.Serial) -> None:
+    """
+    Best-effort attempt to reduce the USB-serial adapter's receive latency.
+    Failures are only logged since not every adapter/platform supports this.
+    """
+    latency_timer_path = os.path.join(
+        "/sys/bus/usb-serial/devices",
+        os.path.basename(os.path.realpath(raw_serial.port)),
+        "latency_timer",
+    )
+    try:
+        with open(latency_timer_path, "w", encoding="ascii") as latency_timer:
+            latency_timer.write(USB_SERIAL_LATENCY_TIMER_MS)
+    except OSError as e:
+        logging.debug("Unable to set %s: %s", latency_timer_path, e)
+
+    # Sets ASYNC_LOW_LATENCY via TIOCSSERIAL, which pyserial only implements on
+    # Linux
+    try:
+        raw_serial.set_low_latency_mode(True)
+    except (NotImplementedError, OSError, ValueError) as e:
+        logging.debug("Unable to enable low latency mode on %s: %s", raw_serial.port, e)
 
 
 if __name__ == "__main__":